@@ -1,17 +1,220 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, stream_with_context
+from flask_compress import Compress
 from flask_cors import CORS
+import atexit
+import hashlib
 import os
+import shutil
 import tempfile
+import threading
+import uuid
 import base64
+import math
+import numbers
+import re
+import zipfile
+from datetime import date, datetime, timedelta
 from io import BytesIO
+from xml.sax.saxutils import escape
 
+import orjson
 import pandas as pd
+from werkzeug.http import http_date
 
-from matcher_core import run_matching_core
+from matcher_core import run_matching_core, warm_up_kernels
 
 app = Flask(__name__)
 CORS(app)
 
+# gzip JSON responses for clients that accept it (rows, log text and the
+# base64 workbooks all compress well); tiny responses are left alone
+app.config["COMPRESS_MIN_SIZE"] = 2048
+app.config["COMPRESS_ALGORITHM"] = "gzip"
+Compress(app)
+
+# JIT-compile the matcher kernels at boot rather than on the first request
+warm_up_kernels()
+
+# Per-process scratch directory, created on first use and keyed on the pid:
+# workers forked after import (gunicorn --preload, worker recycling) each get
+# their own, and only the process that created it removes it at exit. Each
+# request gets its own sub-directory inside it.
+_scratch = None  # (pid, path) of this process's scratch dir
+_scratch_lock = threading.Lock()
+
+
+def _remove_scratch_dir(pid, path):
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _scratch_dir():
+    global _scratch
+    pid = os.getpid()
+    with _scratch_lock:
+        if _scratch is None or _scratch[0] != pid:
+            path = tempfile.mkdtemp(prefix=f"alloc-{pid}-")
+            os.makedirs(os.path.join(path, "cache"))
+            atexit.register(_remove_scratch_dir, pid, path)
+            _scratch = (pid, path)
+        return _scratch[1]
+
+
+# Finished /api/run-matching payloads, keyed on the uploaded file contents.
+# Lives inside the scratch dir, so it never outlives the running code.
+def _cache_dir():
+    return os.path.join(_scratch_dir(), "cache")
+
+
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+# ------------------------------------------------------------
+# MINIMAL XLSX WRITER  (values-only, single sheet)
+# ------------------------------------------------------------
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Only number formats: cell style 1 = datetime, 2 = date, in the formats
+# pandas' openpyxl writer used
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2">'
+    '<numFmt numFmtId="164" formatCode="YYYY-MM-DD HH:MM:SS"/>'
+    '<numFmt numFmtId="165" formatCode="YYYY-MM-DD"/>'
+    '</numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+# Day 0 of Excel's (1900) date serials
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def _column_letter(idx):
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA', ..."""
+    letters = ""
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+# Characters XML 1.0 does not allow (C0 controls other than tab / newline /
+# carriage return, lone surrogates, U+FFFE / U+FFFF). Text pasted into Excel
+# can carry them (e.g. \x0b), and one of them makes the whole sheet unreadable.
+_XML_ILLEGAL_RE = re.compile("[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+
+
+def _xlsx_cell(ref, value):
+    """
+    Render one <c> element. None / NaN / inf / NaT are left out (empty cell);
+    dates and Timestamps become real date cells (day serial plus a date
+    style), dropping any timezone; characters XML cannot hold are dropped
+    from strings.
+    """
+    if value is None or value is pd.NaT or value is pd.NA:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Integral):
+        return f'<c r="{ref}"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if not math.isfinite(value):
+            return ""
+        return f'<c r="{ref}"><v>{value!r}</v></c>'
+    if isinstance(value, datetime):
+        serial = (value.replace(tzinfo=None) - _EXCEL_EPOCH) / timedelta(days=1)
+        return f'<c r="{ref}" s="1"><v>{serial!r}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="2"><v>{(value - _EXCEL_EPOCH.date()).days}</v></c>'
+    return (
+        f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">'
+        f"{escape(_XML_ILLEGAL_RE.sub('', str(value)))}</t></is></c>"
+    )
+
+
+def fast_xlsx(rows, columns, out=None):
+    """
+    Build a single-sheet XLSX file from a list of dicts.
+    The XML parts are generated directly: header row = columns, then one row
+    per dict, values looked up by column name.
+    If `out` (a seekable binary file object) is given the workbook is written
+    into it; otherwise the bytes are returned.
+    """
+    if out is None:
+        buffer = BytesIO()
+        fast_xlsx(rows, columns, buffer)
+        return buffer.getvalue()
+
+    letters = [_column_letter(i) for i in range(len(columns))]
+
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES_XML)
+        zf.writestr("_rels/.rels", _ROOT_RELS_XML)
+        zf.writestr("xl/workbook.xml", _WORKBOOK_XML)
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS_XML)
+        zf.writestr("xl/styles.xml", _STYLES_XML)
+
+        # Stream the sheet row by row so the full XML never sits in memory
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>"
+            )
+            header = "".join(_xlsx_cell(f"{l}1", c) for l, c in zip(letters, columns))
+            sheet.write(f'<row r="1">{header}</row>'.encode("utf-8"))
+            for i, r in enumerate(rows, start=2):
+                cells = "".join(_xlsx_cell(f"{l}{i}", r.get(c)) for l, c in zip(letters, columns))
+                sheet.write(f'<row r="{i}">{cells}</row>'.encode("utf-8"))
+            sheet.write(b"</sheetData></worksheet>")
+
+
+# Read size for incremental base64: a multiple of 3 bytes, so the encoded
+# chunks concatenate without padding in the middle.
+_B64_CHUNK = 3 * 256 * 1024
+
 
 def df_to_excel_base64(rows):
     """
@@ -20,45 +223,210 @@ def df_to_excel_base64(rows):
     """
     if not rows:
         return None
-    df = pd.DataFrame(rows)
-    buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-    buffer.seek(0)
-    return base64.b64encode(buffer.read()).decode("utf-8")
+
+    # Rows already share one schema; take the columns from the first one.
+    cols = list(rows[0].keys())
+
+    # Small workbooks stay in RAM, large ones spill to disk instead of
+    # repeatedly growing a BytesIO buffer.
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as buffer:
+        fast_xlsx(rows, cols, buffer)
+        buffer.seek(0)
+        parts = []
+        while True:
+            chunk = buffer.read(_B64_CHUNK)
+            if not chunk:
+                break
+            parts.append(base64.b64encode(chunk))
+    return b"".join(parts).decode("ascii")
+
+
+# Keys sorted and datetimes passed to _json_default to keep the same output
+# as flask.jsonify
+_ORJSON_OPTS = (
+    orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+)
+
+
+def _json_default(obj):
+    """
+    orjson fallback for values found in uploaded sheets: dates / Timestamps
+    become HTTP-date strings like flask.jsonify gave, NaT / NA become null.
+    """
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, date):
+        return http_date(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _dumps(obj):
+    return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTS)
+
+
+def ojson(obj, status=200):
+    """
+    JSON response encoded with orjson (NaN / Infinity become null).
+    """
+    return Response(
+        _dumps(obj),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+# Health-check body never changes, so encode it once. A fresh Response is
+# still built per hit: flask-cors adds headers to the response object.
+_HEALTH_BODY = _dumps(
+    {"status": "ok", "message": "Sec 2 Subject Allocation backend running"}
+)
 
 
 @app.route("/", methods=["GET"])
 def health_check():
-    return jsonify(
-        {"status": "ok", "message": "Sec 2 Subject Allocation backend running"}
-    )
+    return Response(_HEALTH_BODY, mimetype="application/json")
 
 
-@app.route("/api/run-matching", methods=["POST"])
-def run_matching():
+def _save_upload(file_storage, path):
+    """
+    Persist an uploaded file to `path`.
+    If Werkzeug already spooled the upload to a real file, copy it in the
+    kernel with os.sendfile; otherwise copy with a 1 MiB buffer.
+    """
+    src = file_storage.stream
+    with open(path, "wb") as dst:
+        if isinstance(src, tempfile.SpooledTemporaryFile) and getattr(src, "_rolled", False):
+            try:
+                src_fd = src._file.fileno()
+                size = os.fstat(src_fd).st_size
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                if offset == size:
+                    return
+            except (AttributeError, OSError):
+                pass
+            # fall back to a plain copy from the start
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+        shutil.copyfileobj(src, dst, length=1 << 20)
+
+
+def _run_uploaded_matching():
+    """
+    Save the uploaded student/course workbooks to a per-request scratch
+    directory and run the matching core on them.
+    Returns the core's result dict, or None if either upload is missing.
+    """
+    # --- Validate input files ---
+    if "student_file" not in request.files or "course_file" not in request.files:
+        return None
+
+    student_file = request.files["student_file"]
+    course_file = request.files["course_file"]
+
+    # --- Use a per-request directory inside the worker's scratch dir ---
+    run_dir = os.path.join(_scratch_dir(), uuid.uuid4().hex)
+    os.makedirs(run_dir)
     try:
-        # --- Validate input files ---
-        if "student_file" not in request.files or "course_file" not in request.files:
-            return jsonify({"error": "Missing student_file or course_file"}), 400
+        student_path = os.path.join(run_dir, "studentdata.xlsx")
+        course_path = os.path.join(run_dir, "coursedata.xlsx")
+
+        _save_upload(student_file, student_path)
+        _save_upload(course_file, course_path)
+
+        # Run your core matching logic (now returns log_text). The run dir is
+        # deleted on return and the endpoints build their own workbooks from
+        # the rows, so the core writes no Excel files and needs no output
+        # folder (run_name only feeds the response cache key).
+        return run_matching_core(
+            student_path, course_path, run_dir, save_excel=False, serialize=True
+        )
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+# ------------------------------------------------------------
+# RESPONSE CACHE  (same uploads -> same payload)
+# ------------------------------------------------------------
+def _upload_digest(file_storage):
+    """BLAKE2b digest of an upload's contents; the stream is rewound after."""
+    h = hashlib.blake2b(digest_size=16)
+    stream = file_storage.stream
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(1 << 20), b""):
+        h.update(chunk)
+    stream.seek(0)
+    return h.hexdigest()
+
+
+def _cache_path(student_file, course_file, run_name):
+    run_key = hashlib.blake2b(run_name.encode("utf-8"), digest_size=8).hexdigest()
+    key = f"{_upload_digest(student_file)}-{_upload_digest(course_file)}-{run_key}"
+    return os.path.join(_cache_dir(), f"{key}.json")
+
+
+def _cache_get(path):
+    """Cached payload bytes, or None on a miss."""
+    try:
+        with open(path, "rb") as f:
+            body = f.read()
+    except OSError:
+        return None
+    # mtime doubles as last-used time for eviction (atime is often disabled)
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return body
+
+
+def _cache_put(path, body):
+    """Atomically store a payload, then evict least recently used entries."""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
 
-        student_file = request.files["student_file"]
-        course_file = request.files["course_file"]
-        run_name = request.form.get("run_name", "run")
+    entries = []
+    for entry in os.scandir(_cache_dir()):
+        if entry.name.endswith(".json"):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, old_path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+        total -= size
 
-        # --- Use temporary directory for processing ---
-        with tempfile.TemporaryDirectory() as tmpdir:
-            student_path = os.path.join(tmpdir, "studentdata.xlsx")
-            course_path = os.path.join(tmpdir, "coursedata.xlsx")
 
-            student_file.save(student_path)
-            course_file.save(course_path)
+@app.route("/api/run-matching", methods=["POST"])
+def run_matching():
+    try:
+        if "student_file" not in request.files or "course_file" not in request.files:
+            return ojson({"error": "Missing student_file or course_file"}, 400)
 
-            output_folder = os.path.join(tmpdir, run_name)
-            os.makedirs(output_folder, exist_ok=True)
+        cache_path = _cache_path(
+            request.files["student_file"],
+            request.files["course_file"],
+            request.form.get("run_name", "run"),
+        )
+        body = _cache_get(cache_path)
+        if body is not None:
+            return Response(body, mimetype="application/json")
 
-            # Run your core matching logic (now returns log_text)
-            result = run_matching_core(student_path, course_path, output_folder)
+        result = _run_uploaded_matching()
 
         # Extract result pieces
         students = result.get("students", [])
@@ -81,11 +449,79 @@ def run_matching():
             "log_text": log_text,
         }
 
-        return jsonify(payload)
+        body = _dumps(payload)
+        _cache_put(cache_path, body)
+        return Response(body, mimetype="application/json")
 
     except Exception as e:
         print("Error in /api/run-matching:", repr(e))
-        return jsonify({"error": "Internal server error", "details": str(e)}), 500
+        return ojson({"error": "Internal server error", "details": str(e)}, 500)
+
+
+@app.route("/api/run-matching-multipart", methods=["POST"])
+def run_matching_multipart():
+    """
+    Same matching as /api/run-matching, but returned as multipart/mixed:
+    first a JSON part with the rows and log, then one part per non-empty
+    workbook carrying the raw XLSX bytes (no base64).
+    """
+    try:
+        result = _run_uploaded_matching()
+        if result is None:
+            return ojson({"error": "Missing student_file or course_file"}, 400)
+
+        students = result.get("students", [])
+        course_report = result.get("course_report", [])
+        unplaced = result.get("unplaced", [])
+        workbooks = [
+            (name, rows)
+            for name, rows in (
+                ("students_xlsx", students),
+                ("course_report_xlsx", course_report),
+                ("unplaced_xlsx", unplaced),
+            )
+            if rows
+        ]
+
+        # Encoded here so a value orjson rejects still gets a 500, not a
+        # 200 cut off mid-stream
+        metadata_body = _dumps(
+            {
+                "students": students,
+                "course_report": course_report,
+                "unplaced": unplaced,
+                "excel_files": [name for name, _ in workbooks],
+                "log_text": result.get("log_text", ""),
+            }
+        )
+        boundary = uuid.uuid4().hex
+
+    except Exception as e:
+        print("Error in /api/run-matching-multipart:", repr(e))
+        return ojson({"error": "Internal server error", "details": str(e)}, 500)
+
+    def generate():
+        yield (
+            f"--{boundary}\r\n"
+            "Content-Type: application/json\r\n"
+            'Content-Disposition: inline; name="metadata"\r\n\r\n'
+        ).encode("utf-8")
+        yield metadata_body
+
+        for name, rows in workbooks:
+            yield (
+                f"\r\n--{boundary}\r\n"
+                "Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n"
+                f'Content-Disposition: attachment; name="{name}"; filename="{name[:-5]}.xlsx"\r\n\r\n'
+            ).encode("utf-8")
+            yield fast_xlsx(rows, list(rows[0].keys()))
+
+        yield f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=f"multipart/mixed; boundary={boundary}",
+    )
 
 
 if __name__ == "__main__":
@@ -1,4 +1,8 @@
+import heapq
+import itertools
+import logging
 import os
+import numpy as np
 import pandas as pd
 #import tkinter as tk
 #from tkinter import filedialog
@@ -6,44 +10,111 @@ import re
 import math
 from collections import deque  # Import deque for managing displaced students
 
+try:
+    from numba import njit
+    _HAVE_NUMBA = True
+except ImportError:  # numba not installed: the Python DA loop is used instead
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+try:
+    import python_calamine  # noqa: F401  (Rust xlsx parser, picked up by pandas)
+    _EXCEL_ENGINE = 'calamine'
+except ImportError:  # python-calamine not installed: pandas' default (openpyxl)
+    _EXCEL_ENGINE = None
+
+try:
+    import xlsxwriter  # noqa: F401  (faster report writer than openpyxl)
+    # No constant_memory: pandas writes cell by cell in column order, and
+    # xlsxwriter's constant_memory mode drops anything not written row by row
+    _EXCEL_WRITER_ENGINE = 'xlsxwriter'
+except ImportError:  # xlsxwriter not installed: pandas' default (openpyxl)
+    _EXCEL_WRITER_ENGINE = None
+
+# Per-attempt matching trace goes to DEBUG (off by default): formatting and
+# writing it costs more than the matching itself on real inputs.
+logger = logging.getLogger("da")
+logger.setLevel(logging.INFO)
+
+# Course criteria cells look like '>= 70' or '<=60'
+_CRITERIA_RE = re.compile(r'([<>]=?)\s*(\d+)')
+
+
+def _read_excel(file_path):
+    """
+    Load the first sheet of an input workbook. Every column is used
+    (marks / criteria), so there is no usecols to narrow it down.
+    """
+    return pd.read_excel(file_path, engine=_EXCEL_ENGINE)
+
+
 def read_student_data(file_path):
-    df = pd.read_excel(file_path)
+    df = _read_excel(file_path)
     student_preferences = {}
     student_marks = {}
 
     num_preferences = sum(col.startswith('Preference') for col in df.columns[1:-1])
 
-    for index, row in df.iterrows():
-        student_name = row['Student Name']
-        preferences = [course.strip() for course in row.iloc[1:1 + num_preferences]]
-        marks = {col: row[col] for col in row.index[1 + num_preferences:-1]}
+    # Column positions, resolved once; rows are then plain tuples
+    cols = df.columns.tolist()
+    name_idx = cols.index('Student Name')
+    total_idx = cols.index('Total Score')
+    pref_slice = slice(1, 1 + num_preferences)
+    marks_slice = slice(1 + num_preferences, -1)
+    mark_cols = cols[marks_slice]
 
-        total_score = row['Total Score']
+    for row in df.itertuples(index=False, name=None):
+        student_name = row[name_idx]
+        preferences = tuple(course.strip() for course in row[pref_slice])
+        marks = dict(zip(mark_cols, row[marks_slice]))
+
+        total_score = row[total_idx]
         marks['Total Score'] = total_score
         marks['Overall Score'] = total_score
 
-        for i, preference in enumerate(preferences):
-            marks[f'Preference {i + 1}'] = preference
-
         student_preferences[student_name] = preferences
         student_marks[student_name] = marks
 
-    return student_marks, num_preferences
+    return student_marks, num_preferences, student_preferences
+
+
+def preference_columns(student_names, student_preferences, num_preferences):
+    """
+    The 'Preference k' report columns for student_names, one list per column.
+    """
+    rows = [student_preferences.get(name, ()) for name in student_names]
+    return {
+        f'Preference {k + 1}': [prefs[k] if k < len(prefs) else None for prefs in rows]
+        for k in range(num_preferences)
+    }
 
 
 def read_course_data(file_path):
-    df = pd.read_excel(file_path)
+    df = _read_excel(file_path)
     course_data = {}
 
-    for index, row in df.iterrows():
-        course_name = row['Course Name']
-        group = row.get('Group')
-        group_constraint = row.get('Group Constraint')
+    cols = df.columns.tolist()
+    name_idx = cols.index('Course Name')
+    capacity_idx = cols.index('Capacity')
+    # Optional columns: None when absent (row.get() behaviour)
+    group_idx = cols.index('Group') if 'Group' in cols else None
+    constraint_idx = cols.index('Group Constraint') if 'Group Constraint' in cols else None
+    tiebreak_idx = cols.index('Tiebreaker Subjects') if 'Tiebreaker Subjects' in cols else None
+    criteria_cols = cols[2:]
 
-        subject_criteria = {col: row[col] for col in row.index[2:]}
+    for row in df.itertuples(index=False, name=None):
+        course_name = row[name_idx]
+        group = row[group_idx] if group_idx is not None else None
+        group_constraint = row[constraint_idx] if constraint_idx is not None else None
+
+        subject_criteria = dict(zip(criteria_cols, row[2:]))
 
         # Treat capacity as infinite if group constraint is NaN or empty
-        capacity = row['Capacity'] if pd.notna(row['Capacity']) else None
+        capacity = row[capacity_idx] if pd.notna(row[capacity_idx]) else None
 
         if capacity is None:
             if pd.isna(group_constraint):
@@ -54,13 +125,13 @@ def read_course_data(file_path):
         subject_criteria_dict = {}
         for subject, criteria in subject_criteria.items():
             if pd.notna(criteria):
-                match = re.match(r'([<>]=?)\s*(\d+)', str(criteria))
+                match = _CRITERIA_RE.match(str(criteria))
                 if match:
                     inequality, value = match.groups()
                     subject_criteria_dict[subject] = (inequality, int(value))
 
         # Handle tiebreaker subjects
-        tiebreaker_subjects = row.get('Tiebreaker Subjects')
+        tiebreaker_subjects = row[tiebreak_idx] if tiebreak_idx is not None else None
         if pd.notna(tiebreaker_subjects) and tiebreaker_subjects.strip():
             tiebreaker_subjects = [subject.strip() for subject in tiebreaker_subjects.split(",")]
         else:
@@ -78,35 +149,6 @@ def read_course_data(file_path):
 
 
 
-def student_meets_course_criteria(student_name, student_marks, preferred_course, course_data):
-    """
-    Check if a student meets the criteria for a specific course.
-    """
-    course_info = course_data.get(preferred_course)
-    if not course_info:
-        return False
-
-    # Ensure the student meets the subject criteria
-    return all(
-        compare_subject_score(student_marks[student_name].get(subject, 0), inequality, value)
-        for subject, (inequality, value) in course_info['subject_criteria'].items()
-    )
-
-
-def check_group_vacancies(course_data, course_matches, preferred_course, student_marks):
-    """
-    Check if there is still capacity within the group for the preferred course.
-    Returns False if the group is full, otherwise True.
-    """
-    group_constraint = course_data[preferred_course].get('group_constraint')
-    if group_constraint:
-        group_courses = [course_name for course_name, course_info in course_data.items()
-                         if course_info.get('group') == course_data[preferred_course]['group']]
-        total_assigned_students = sum(len(course_matches.get(course_name, [])) for course_name in group_courses)
-        if total_assigned_students >= group_constraint:
-            return False
-    return True
-
 from collections import deque
 import pandas as pd
 
@@ -145,9 +187,106 @@ def compare_subject_score(student_score, inequality, value):
     return False
 
 
+def _to_num_array(values):
+    """
+    Vectorised _to_num: float64 array with NaN for blanks / non-numeric.
+    """
+    return pd.to_numeric(pd.Series(list(values), dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def build_student_table(student_marks, student_preferences, num_preferences, subjects):
+    """
+    Column-oriented (SoA) view of student_marks for the matching loop.
+    Row i of every array is student names[i]; student_id maps name -> i.
+    - total_score: float64 Total Score (NaN if not numeric)
+    - preferences: object array (n, num_preferences), None where missing
+    - subject_scores: float64 (n, len(subjects)) numeric scores, NaN if not numeric
+    student_marks itself is left untouched (reports print the raw values).
+    """
+    names = list(student_marks)
+    rows = [student_marks[name] for name in names]
+
+    preferences = np.full((len(names), num_preferences), None, dtype=object)
+    for i, name in enumerate(names):
+        prefs = student_preferences.get(name, ())[:num_preferences]
+        preferences[i, :len(prefs)] = prefs
+
+    subject_scores = np.empty((len(names), len(subjects)), dtype=np.float64)
+    for j, subject in enumerate(subjects):
+        subject_scores[:, j] = _to_num_array(marks.get(subject, None) for marks in rows)
+
+    return {
+        'names': names,
+        'student_id': {name: i for i, name in enumerate(names)},
+        'total_score': _to_num_array(marks.get('Total Score') for marks in rows),
+        'preferences': preferences,
+        'subjects': list(subjects),
+        'subject_idx': {subject: j for j, subject in enumerate(subjects)},
+        'subject_scores': subject_scores,
+    }
+
+
+def build_course_eligibility(student_table, course_data):
+    """
+    Evaluate every course's subject criteria for every student up front.
+    Returns eligible: course name -> bool array over the student_table rows.
+    student_table must hold every criteria subject in its subject_scores.
+    Same rules as compare_subject_score: non-numeric scores fail.
+    """
+    n_students = len(student_table['names'])
+    subject_idx = student_table['subject_idx']
+    scores = student_table['subject_scores']
+
+    eligible = {}
+    for course_name, info in course_data.items():
+        criteria = info.get('subject_criteria', {})
+        if any(inequality not in ('>=', '<=') for inequality, _ in criteria.values()):
+            # compare_subject_score fails anything other than >= / <=
+            eligible[course_name] = np.zeros(n_students, dtype=bool)
+            continue
+        cols = [subject_idx[subject] for subject in criteria]
+        lo = np.array([_to_num(v) if op == '>=' else -np.inf for op, v in criteria.values()])
+        hi = np.array([_to_num(v) if op == '<=' else np.inf for op, v in criteria.values()])
+        sub = scores[:, cols]
+        eligible[course_name] = ((sub >= lo) & (sub <= hi)).all(axis=1)
+
+    return eligible
+
+
+def build_feasible_preferences(student_table, eligible):
+    """
+    feasible[i, k] is True when student_table row i's (k+1)-th preference
+    names a known course whose subject criteria the student meets.
+    Infeasible pairs cannot be placed whatever the state of the match.
+    """
+    preferences = student_table['preferences']
+    feasible = np.zeros(preferences.shape, dtype=bool)
+    for k in range(preferences.shape[1]):
+        for course in set(preferences[:, k]):
+            if course in eligible:
+                rows = preferences[:, k] == course
+                feasible[rows, k] = eligible[course][rows]
+    return feasible
+
+
 # Try to place a student in the course with displacement logic
-def try_place_student_in_course(student_name, student_marks, preferred_course, course_data, course_matches, student_course_assignment, group_capacity_tracker, unplaced_students):
-    print(f"\nConsidering student: {student_name} for course: {preferred_course}")
+#
+# When group_to_courses / course_to_group are passed (see
+# build_group_index), group_capacity_tracker is treated as the live count
+# of students per group and kept up to date on every place/remove here.
+# group_merit (see new_group_merit_index) additionally keeps a min-heap per
+# group so the lowest-merit student is found without scanning the group.
+# tiebreak_cache (a dict, tiebreaker subjects -> {student: tuple}) memoises
+# the tiebreaker tuples across calls; marks never change during a run.
+# student_table (see build_student_table) supplies the numeric Total Score.
+# Passing eligible (see build_course_eligibility) means the caller has
+# already checked the subject criteria, so they are not re-checked here.
+#
+# course_matches maps course -> roster, where a roster is a dict used as an
+# insertion-ordered set (student -> None): O(1) membership and removal,
+# placement order kept for the reports.
+def try_place_student_in_course(student_name, student_marks, preferred_course, course_data, course_matches, student_course_assignment, group_capacity_tracker, unplaced_students, eligible=None, student_table=None, group_to_courses=None, course_to_group=None, group_merit=None, tiebreak_cache=None):
+    logger.debug("Considering student: %s for course: %s", student_name, preferred_course)
 
     # ---------------- helpers ----------------
     def _safe_tie_score(x):
@@ -155,16 +294,58 @@ def try_place_student_in_course(student_name, student_marks, preferred_course, c
         val = _to_num(x)
         return val if not math.isnan(val) else float('-inf')
 
+    def _tie_tuple(name, subjects):
+        """Tiebreaker tuple for name, memoised in tiebreak_cache when given."""
+        if tiebreak_cache is None:
+            return tuple(_safe_tie_score(student_marks[name].get(subj)) for subj in subjects)
+        cache = tiebreak_cache.setdefault(tuple(subjects), {})
+        tie = cache.get(name)
+        if tie is None:
+            tie = cache[name] = tuple(_safe_tie_score(student_marks[name].get(subj)) for subj in subjects)
+        return tie
+
     def _total_score(name):
         """Numeric Total Score (NaN if invalid)."""
+        if student_table is not None:
+            return student_table['total_score'][student_table['student_id'][name]]
         return _to_num(student_marks[name].get('Total Score'))
 
+    def _count_in_group(course_name, name, delta):
+        """Keep the live per-group count (and merit heap) in step with course_matches."""
+        if course_to_group is None:
+            return
+        group = course_to_group.get(course_name)
+        if group is None:
+            return
+        group_capacity_tracker[group] = group_capacity_tracker.get(group, 0) + delta
+        if group_merit is None:
+            return
+
+        live = group_merit['live']
+        non_numeric = group_merit['non_numeric']
+        if delta > 0:
+            total = _total_score(name)
+            if math.isnan(total):
+                live[name] = -1  # -1: member without a numeric Total Score
+                non_numeric[group] = non_numeric.get(group, 0) + 1
+            else:
+                seq = next(group_merit['seq'])
+                live[name] = seq
+                heapq.heappush(
+                    group_merit['heaps'][group],
+                    (total, group_merit['course_rank'][course_name], seq, name),
+                )
+        elif live.pop(name, None) == -1:
+            non_numeric[group] -= 1
+        # heap entries of removed students go stale and are skipped lazily
+
     def _place_into(course_to_place):
         """Append student to course_to_place and record assignment (no double-append)."""
         if course_to_place not in course_matches:
-            course_matches[course_to_place] = []
+            course_matches[course_to_place] = {}
         if student_name not in course_matches[course_to_place]:
-            course_matches[course_to_place].append(student_name)
+            course_matches[course_to_place][student_name] = None
+            _count_in_group(course_to_place, student_name, 1)
         student_course_assignment[student_name] = course_to_place
         return True
 
@@ -172,24 +353,26 @@ def try_place_student_in_course(student_name, student_marks, preferred_course, c
         """Remove a student from whichever course currently holds them (if any)."""
         prev = student_course_assignment.get(student_to_remove)
         if prev and prev in course_matches and student_to_remove in course_matches[prev]:
-            course_matches[prev].remove(student_to_remove)
+            del course_matches[prev][student_to_remove]
+            _count_in_group(prev, student_to_remove, -1)
         if student_to_remove in student_course_assignment:
             del student_course_assignment[student_to_remove]
 
     # --------------- course presence ---------------
     course_info = course_data.get(preferred_course)
     if not course_info:
-        print(f"Course {preferred_course} not found in course data.")
+        logger.debug("Course %s not found in course data.", preferred_course)
         return False
 
     # --------------- subject criteria ---------------
-    # Ensure the student meets all subject criteria (numeric-safe)
-    if not all(
-        compare_subject_score(student_marks[student_name].get(subject, None), inequality, value)
-        for subject, (inequality, value) in course_info.get('subject_criteria', {}).items()
-    ):
-        print(f"Student {student_name} does not meet the criteria for {preferred_course}.\n")
-        return False
+    # Ensure the student meets all subject criteria (numeric-safe).
+    # With eligible given the caller only sends feasible pairs.
+    if eligible is None:
+        marks = student_marks[student_name]
+        for subject, (inequality, value) in course_info.get('subject_criteria', {}).items():
+            if not compare_subject_score(marks.get(subject, None), inequality, value):
+                logger.debug("Student %s does not meet the criteria for %s.", student_name, preferred_course)
+                return False
 
     capacity = course_info.get('capacity')
     current_students = course_matches.get(preferred_course, [])
@@ -209,14 +392,14 @@ def try_place_student_in_course(student_name, student_marks, preferred_course, c
             cap_val = None  # infinite
 
         if cap_val is not None and len(current_students) >= cap_val:
-            print(f"Course {preferred_course} is full. Cannot place {student_name}.")
+            logger.debug("Course %s is full. Cannot place %s.", preferred_course, student_name)
             return False
 
         # place (remove from old course first to avoid duplicates)
         if student_course_assignment.get(student_name) and student_course_assignment[student_name] != preferred_course:
             _remove_from_course(student_name)
 
-        print(f"Course {preferred_course} has capacity. Placing student {student_name}.")
+        logger.debug("Course %s has capacity. Placing student %s.", preferred_course, student_name)
         placed = _place_into(preferred_course)
         if student_name in unplaced_students:
             unplaced_students.remove(student_name)
@@ -224,14 +407,17 @@ def try_place_student_in_course(student_name, student_marks, preferred_course, c
 
     # --------------- group-constrained logic ---------------
     # Collect all courses in this group
-    group_courses = [cname for cname, info in course_data.items() if info.get('group') == group_name]
+    if group_to_courses is not None:
+        group_courses = group_to_courses.get(group_name, [])
+    else:
+        group_courses = [cname for cname, info in course_data.items() if info.get('group') == group_name]
 
-    # Ensure course_matches entries exist for all group courses (debug visibility)
+    # Ensure course_matches entries exist for all group courses (this also
+    # fixes where they appear in course_matches, and so in the reports)
     for cname in group_courses:
         if cname not in course_matches:
-            print(f"Initializing missing course: {cname}")
-            course_matches[cname] = []
-        print(f"Current students in course '{cname}': {course_matches[cname]}")
+            logger.debug("Initializing missing course: %s", cname)
+            course_matches[cname] = {}
 
     # Compute numeric group limit (None => treat as no cap)
     if group_constraint is not None and pd.notna(group_constraint):
@@ -242,54 +428,65 @@ def try_place_student_in_course(student_name, student_marks, preferred_course, c
     else:
         group_limit = None
 
-    all_group_students = []
-    for cname in group_courses:
-        all_group_students.extend(course_matches.get(cname, []))
-    total_group_students = len(all_group_students)
+    if course_to_group is not None:
+        total_group_students = group_capacity_tracker.get(group_name, 0)
+    else:
+        total_group_students = sum(len(course_matches.get(cname, [])) for cname in group_courses)
 
     # If no valid cap or cap not reached -> place directly
     if (group_limit is None) or (total_group_students < group_limit):
-        print(f"Group {group_name}: capacity available (limit={group_limit}, used={total_group_students}). Placing {student_name}.")
+        logger.debug("Group %s: capacity available (limit=%s, used=%s). Placing %s.", group_name, group_limit, total_group_students, student_name)
         if student_course_assignment.get(student_name) and student_course_assignment[student_name] != preferred_course:
             _remove_from_course(student_name)
         placed = _place_into(preferred_course)
-        if group_limit is not None:
+        if course_to_group is None and group_limit is not None:
             group_capacity_tracker[group_name] = total_group_students + 1
         if student_name in unplaced_students:
             unplaced_students.remove(student_name)
         return placed
 
     # Group is full: consider displacement
-    print(f"Group {group_name} has reached its constraint. Checking for displacement across all group courses.")
-
-    # Find lowest-merit student by Total Score first (numeric-safe)
-    if not all_group_students:
-        return False  # guard
-
-    lowest_merit_student = min(all_group_students, key=_total_score)
+    logger.debug("Group %s has reached its constraint. Checking for displacement across all group courses.", group_name)
+
+    def _all_group_students():
+        return [stu for cname in group_courses for stu in course_matches.get(cname, [])]
+
+    # Find lowest-merit student by Total Score first (numeric-safe).
+    # The heap gives the same student as min() over the group in course order
+    # (ties -> earliest placed). With a non-numeric Total Score in the group
+    # min()'s result depends on order, so scan the group as before.
+    if group_merit is not None and not group_merit['non_numeric'].get(group_name):
+        heap = group_merit['heaps'][group_name]
+        live = group_merit['live']
+        while heap and live.get(heap[0][3]) != heap[0][2]:
+            heapq.heappop(heap)
+        if not heap:
+            return False  # guard
+        lowest_merit_student = heap[0][3]
+    else:
+        all_group_students = _all_group_students()
+        if not all_group_students:
+            return False  # guard
+        lowest_merit_student = min(all_group_students, key=_total_score)
 
     candidate_total = _total_score(student_name)
     lowest_total = _total_score(lowest_merit_student)
 
     if math.isnan(candidate_total):
-        print(f"Candidate {student_name} has non-numeric Total Score; cannot displace.")
+        logger.debug("Candidate %s has non-numeric Total Score; cannot displace.", student_name)
         return False
 
     if candidate_total > lowest_total:
         # Displace on higher Total Score
-        print(f"Student {student_name} will displace {lowest_merit_student} from group {group_name} (Total Score comparison).")
-        # remove displaced from whichever course
-        for cname in group_courses:
-            if lowest_merit_student in course_matches.get(cname, []):
-                course_matches[cname].remove(lowest_merit_student)
-                if lowest_merit_student in student_course_assignment:
-                    del student_course_assignment[lowest_merit_student]
-                break
+        logger.debug("Student %s will displace %s from group %s (Total Score comparison).", student_name, lowest_merit_student, group_name)
+        # remove displaced from the course they hold
+        _remove_from_course(lowest_merit_student)
 
         # place candidate
         if student_course_assignment.get(student_name) and student_course_assignment[student_name] != preferred_course:
             _remove_from_course(student_name)
-        course_matches.setdefault(preferred_course, []).append(student_name)
+        course_matches.setdefault(preferred_course, {})[student_name] = None
+        _count_in_group(preferred_course, student_name, 1)
         student_course_assignment[student_name] = preferred_course
 
         # add displaced to unplaced list and return their name (your original behavior)
@@ -302,110 +499,520 @@ def try_place_student_in_course(student_name, student_marks, preferred_course, c
         if tiebreaker_subjects:
             # Re-identify "lowest" under lexicographic tiebreaker tuple
             lowest_merit_student = min(
-                all_group_students,
-                key=lambda s: tuple(_safe_tie_score(student_marks[s].get(subj)) for subj in tiebreaker_subjects)
+                _all_group_students(),
+                key=lambda s: _tie_tuple(s, tiebreaker_subjects)
             )
 
-            candidate_tuple = tuple(_safe_tie_score(student_marks[student_name].get(subj)) for subj in tiebreaker_subjects)
-            lowest_tuple    = tuple(_safe_tie_score(student_marks[lowest_merit_student].get(subj)) for subj in tiebreaker_subjects)
+            candidate_tuple = _tie_tuple(student_name, tiebreaker_subjects)
+            lowest_tuple    = _tie_tuple(lowest_merit_student, tiebreaker_subjects)
 
             if candidate_tuple > lowest_tuple:
-                print(f"Student {student_name} will displace {lowest_merit_student} from group {group_name} (Tiebreaker comparison).")
-                for cname in group_courses:
-                    if lowest_merit_student in course_matches.get(cname, []):
-                        course_matches[cname].remove(lowest_merit_student)
-                        if lowest_merit_student in student_course_assignment:
-                            del student_course_assignment[lowest_merit_student]
-                        break
+                logger.debug("Student %s will displace %s from group %s (Tiebreaker comparison).", student_name, lowest_merit_student, group_name)
+                _remove_from_course(lowest_merit_student)
 
                 if student_course_assignment.get(student_name) and student_course_assignment[student_name] != preferred_course:
                     _remove_from_course(student_name)
-                course_matches.setdefault(preferred_course, []).append(student_name)
+                course_matches.setdefault(preferred_course, {})[student_name] = None
+                _count_in_group(preferred_course, student_name, 1)
                 student_course_assignment[student_name] = preferred_course
 
                 unplaced_students.append(lowest_merit_student)
                 return lowest_merit_student
             else:
-                print(f"Student {student_name} cannot displace {lowest_merit_student} (Tiebreaker comparison).")
+                logger.debug("Student %s cannot displace %s (Tiebreaker comparison).", student_name, lowest_merit_student)
                 return False
         else:
-            print(f"No tiebreaker subjects specified for group {group_name}, using Total Score only.")
+            logger.debug("No tiebreaker subjects specified for group %s, using Total Score only.", group_name)
             return False
 
     # No advantage -> cannot place
-    print(f"Student {student_name} cannot displace any student in group {group_name} (Total Score comparison).")
+    logger.debug("Student %s cannot displace any student in group %s (Total Score comparison).", student_name, group_name)
     return False
 
 
 from collections import deque
 
 
-def deferred_acceptance_with_displacement(student_marks, course_data, num_preferences):
-    course_matches = {}  # Course to students mapping
-    student_course_assignment = {}  # Track which course each student is placed in
-    group_capacity_tracker = {}  # Track how many students are placed in each group
-    unplaced_students = []
-    displaced_students_queue = deque()  # Queue for displaced students
-    preference_tracker = {}  # Tracks each student's last attempted preference
+def build_group_index(course_data):
+    """
+    Map each group to its courses (in course_data order) and each grouped
+    course to its group. Courses with a blank/NaN group are left out.
+    """
+    group_to_courses = {}
+    course_to_group = {}
+    for course_name, info in course_data.items():
+        group = info.get('group')
+        if group and pd.notna(group):
+            group_to_courses.setdefault(group, []).append(course_name)
+            course_to_group[course_name] = group
+    return group_to_courses, course_to_group
 
-    # Queue for students and their current preference being processed
-    students_to_process = deque([(student, 1) for student in student_marks.keys()])
 
-    while students_to_process or displaced_students_queue:
-        if displaced_students_queue:
-            # Prioritize displaced students
-            current_student, current_preference = displaced_students_queue.popleft()
-        else:
-            # Process new students if no displaced students
-            current_student, current_preference = students_to_process.popleft()
+class UnplacedStudents:
+    """
+    unplaced_students for try_place_student_in_course: the same list of
+    names (duplicates and order kept, as the reports show them), but with
+    O(1) 'in' and remove() of the first occurrence.
+    """
+    _REMOVED = object()
 
-        # Update preference_tracker for accurate tracking
-        preference_tracker[current_student] = current_preference
+    def __init__(self):
+        self._names = []
+        self._positions = {}  # name -> deque of its live positions in _names
 
-        # Check if the student has exhausted all preferences
-        if current_preference > num_preferences:
-            print(f"Student {current_student} has exhausted all preferences.")
-            unplaced_students.append(current_student)
-            continue
+    def append(self, name):
+        self._positions.setdefault(name, deque()).append(len(self._names))
+        self._names.append(name)
+
+    def __contains__(self, name):
+        return bool(self._positions.get(name))
 
-        # Process the student's current preference
-        marks = student_marks[current_student]
-        preferred_course = marks.get(f'Preference {current_preference}')
+    def remove(self, name):
+        if not self._positions.get(name):
+            raise ValueError(f"{name!r} is not in unplaced_students")
+        self._names[self._positions[name].popleft()] = self._REMOVED
 
-        if not preferred_course:
-            # Move to the next preference if no preference is listed
-            students_to_process.append((current_student, current_preference + 1))
+    def __iter__(self):
+        return (name for name in self._names if name is not self._REMOVED)
+
+
+def new_group_merit_index(group_to_courses):
+    """
+    Empty per-group merit heaps for try_place_student_in_course.
+    Heap entries are (Total Score, course position in group, placement seq,
+    student); 'live' maps each grouped student to the seq of their current
+    entry, so entries of students who have left are skipped.
+    """
+    return {
+        'heaps': {group: [] for group in group_to_courses},
+        'live': {},
+        'non_numeric': {},  # group -> members whose Total Score is not numeric
+        'course_rank': {
+            course_name: rank
+            for courses in group_to_courses.values()
+            for rank, course_name in enumerate(courses)
+        },
+        'seq': itertools.count(),
+    }
+
+
+# ------------------------------------------------------------
+# COMPILED DA LOOP
+# ------------------------------------------------------------
+# Same algorithm as the Python loop in deferred_acceptance_with_displacement
+# (which, with try_place_student_in_course, stays the reference and is what
+# runs when the DEBUG trace is wanted), on integer ids:
+# - students are student_table rows, courses are course_data positions,
+#   groups are group_to_courses positions; -1 means none
+# - rosters are doubly linked lists in placement order (head/tail per
+#   course, nxt/prv per student: a student is on at most one roster)
+# - unplaced_students is an event list, alive unless the student was later
+#   placed; occ_* chain each student's live events so the first one can be
+#   removed in O(1), like list.remove()
+# - both queues are int32 ring buffers: a student has at most one pending
+#   entry, so they never need to grow
+@njit(cache=True)
+def _tie_less(tie_vals, tie_cols, start, end, a, b):
+    """Tiebreaker tuple of student a < that of student b (lexicographic)."""
+    for j in range(start, end):
+        col = tie_cols[j]
+        if tie_vals[a, col] < tie_vals[b, col]:
+            return True
+        if tie_vals[a, col] > tie_vals[b, col]:
+            return False
+    return False
+
+
+@njit(cache=True)
+def _da_kernel(feasible, pref_course, total, course_group, course_cap, course_has_cap,
+               course_limit, course_has_limit, group_ptr, group_courses, tie_ptr, tie_cols, tie_vals):
+    n, n_prefs = feasible.shape
+    n_courses = course_group.shape[0]
+    n_groups = group_ptr.shape[0] - 1
+
+    head = np.full(n_courses, -1, np.int64)
+    tail = np.full(n_courses, -1, np.int64)
+    size = np.zeros(n_courses, np.int64)
+    nxt = np.full(n, -1, np.int64)
+    prv = np.full(n, -1, np.int64)
+    touched = np.zeros(n_courses, np.bool_)
+    touch_order = np.empty(n_courses, np.int64)
+    n_touched = 0
+    group_count = np.zeros(n_groups, np.int64)
+    assigned = np.full(n, -1, np.int64)
+    assign_seq = np.zeros(n, np.int64)
+    n_assigned = 0
+    tracker = np.zeros(n, np.int64)
+
+    max_events = n * (n_prefs + 2) + 1
+    ev_student = np.empty(max_events, np.int64)
+    ev_alive = np.zeros(max_events, np.bool_)
+    occ_next = np.full(max_events, -1, np.int64)
+    occ_head = np.full(n, -1, np.int64)
+    occ_tail = np.full(n, -1, np.int64)
+    n_events = 0
+
+    # (student row, preference) queues; n + 1 slots never overflow as a
+    # student is queued at most once at a time
+    q_len = n + 1
+    q_s = np.empty(q_len, np.int32)
+    q_k = np.empty(q_len, np.int32)
+    d_s = np.empty(q_len, np.int32)
+    d_k = np.empty(q_len, np.int32)
+    for i in range(n):
+        q_s[i] = i
+        q_k[i] = 1
+    q_head, q_tail = 0, n
+    d_head, d_tail = 0, 0
+
+    while q_head != q_tail or d_head != d_tail:
+        if d_head != d_tail:
+            s = d_s[d_head]
+            k = d_k[d_head]
+            d_head = (d_head + 1) % q_len
+        else:
+            s = q_s[q_head]
+            k = q_k[q_head]
+            q_head = (q_head + 1) % q_len
+        tracker[s] = k
+
+        if k > n_prefs:
+            # exhausted: unplaced_students.append(s)
+            ev_student[n_events] = s
+            ev_alive[n_events] = True
+            if occ_tail[s] == -1:
+                occ_head[s] = n_events
+            else:
+                occ_next[occ_tail[s]] = n_events
+            occ_tail[s] = n_events
+            n_events += 1
             continue
 
-        # Attempt to place the student
-        print(f"\nProcessing {current_student} for preference {current_preference}: {preferred_course}")
-        result = try_place_student_in_course(
-            current_student, student_marks, preferred_course,
-            course_data, course_matches, student_course_assignment,
-            group_capacity_tracker, unplaced_students
-        )
+        c = pref_course[s, k - 1]
+        place = False
+        displaced = -1
+        if feasible[s, k - 1]:
+            g = course_group[c]
+            if g == -1:
+                place = not (course_has_cap[c] and size[c] >= course_cap[c])
+            else:
+                for j in range(group_ptr[g], group_ptr[g + 1]):
+                    cc = group_courses[j]
+                    if not touched[cc]:
+                        touched[cc] = True
+                        touch_order[n_touched] = cc
+                        n_touched += 1
+                if not course_has_limit[c] or group_count[g] < course_limit[c]:
+                    place = True
+                elif not np.isnan(total[s]):
+                    # lowest Total Score in the group, like min(): first wins
+                    low = -1
+                    for j in range(group_ptr[g], group_ptr[g + 1]):
+                        m = head[group_courses[j]]
+                        while m != -1:
+                            if low == -1 or total[m] < total[low]:
+                                low = m
+                            m = nxt[m]
+                    if low != -1:
+                        if total[s] > total[low]:
+                            displaced = low
+                        elif total[s] == total[low] and tie_ptr[c + 1] > tie_ptr[c]:
+                            t0, t1 = tie_ptr[c], tie_ptr[c + 1]
+                            low = -1
+                            for j in range(group_ptr[g], group_ptr[g + 1]):
+                                m = head[group_courses[j]]
+                                while m != -1:
+                                    if low == -1 or _tie_less(tie_vals, tie_cols, t0, t1, m, low):
+                                        low = m
+                                    m = nxt[m]
+                            if _tie_less(tie_vals, tie_cols, t0, t1, low, s):
+                                displaced = low
+
+        if displaced != -1:
+            # take the displaced student off their roster
+            d = displaced
+            dc = assigned[d]
+            if prv[d] == -1:
+                head[dc] = nxt[d]
+            else:
+                nxt[prv[d]] = nxt[d]
+            if nxt[d] == -1:
+                tail[dc] = prv[d]
+            else:
+                prv[nxt[d]] = prv[d]
+            size[dc] -= 1
+            group_count[course_group[dc]] -= 1
+            assigned[d] = -1
+        elif not place:
+            # not placed: try the next preference
+            q_s[q_tail] = s
+            q_k[q_tail] = k + 1
+            q_tail = (q_tail + 1) % q_len
+            continue
 
-        if result is True:
-            # Successful placement; remove any previous assignment if it exists
-            if current_student in student_course_assignment:
-                prior_course = student_course_assignment[current_student]
-                print(f"Removing previous assignment of {current_student} from {prior_course}")
-                course_matches[prior_course].remove(current_student)
-                del student_course_assignment[current_student]
-
-            student_course_assignment[current_student] = preferred_course
-            course_matches.setdefault(preferred_course, []).append(current_student)
-            print(f"{current_student} placed in {preferred_course}")
-
-        elif isinstance(result, str):
-            # A student was displaced; use preference_tracker to accurately queue them for the next preference
-            displaced_student = result
-            next_preference = preference_tracker[displaced_student] + 1
-            print(f"Displaced student {displaced_student} re-added to queue for next preference: {next_preference}")
-            displaced_students_queue.append((displaced_student, next_preference))
+        # place s on c
+        if not touched[c]:
+            touched[c] = True
+            touch_order[n_touched] = c
+            n_touched += 1
+        nxt[s] = -1
+        prv[s] = tail[c]
+        if tail[c] == -1:
+            head[c] = s
         else:
-            # Student was not placed; try the next preference
-            students_to_process.append((current_student, current_preference + 1))
+            nxt[tail[c]] = s
+        tail[c] = s
+        size[c] += 1
+        if course_group[c] != -1:
+            group_count[course_group[c]] += 1
+        assigned[s] = c
+        assign_seq[s] = n_assigned
+        n_assigned += 1
+
+        if displaced == -1:
+            # unplaced_students.remove(s), if listed
+            e = occ_head[s]
+            if e != -1:
+                ev_alive[e] = False
+                occ_head[s] = occ_next[e]
+                if occ_head[s] == -1:
+                    occ_tail[s] = -1
+        else:
+            # unplaced_students.append(d); d goes to their next preference
+            ev_student[n_events] = displaced
+            ev_alive[n_events] = True
+            if occ_tail[displaced] == -1:
+                occ_head[displaced] = n_events
+            else:
+                occ_next[occ_tail[displaced]] = n_events
+            occ_tail[displaced] = n_events
+            n_events += 1
+            d_s[d_tail] = displaced
+            d_k[d_tail] = tracker[displaced] + 1
+            d_tail = (d_tail + 1) % q_len
+
+    return (head, nxt, touch_order[:n_touched], assigned, assign_seq,
+            ev_student[:n_events], ev_alive[:n_events])
+
+
+def _int_or_none(x):
+    """int(x) for a usable capacity / group constraint; None means no limit."""
+    if x is not None and pd.notna(x):
+        try:
+            return int(x)
+        except Exception:
+            return None
+    return None
+
+
+def run_compiled_da(student_marks, course_data, student_table, feasible, group_to_courses):
+    """
+    Translate the matching inputs to integer ids, run _da_kernel and hand
+    back (course_matches, unplaced_students, student_course_assignment)
+    exactly as the Python loop builds them.
+    """
+    names = student_table['names']
+    n = len(names)
+    course_names = list(course_data)
+    course_id = {name: i for i, name in enumerate(course_names)}
+    group_id = {group: i for i, group in enumerate(group_to_courses)}
+
+    preferences = student_table['preferences']
+    pref_course = np.full(preferences.shape, -1, np.int64)
+    for (i, k), course in np.ndenumerate(preferences):
+        if course in course_id:
+            pref_course[i, k] = course_id[course]
+
+    n_courses = len(course_names)
+    course_group = np.full(n_courses, -1, np.int64)
+    course_cap = np.zeros(n_courses, np.int64)
+    course_has_cap = np.zeros(n_courses, np.bool_)
+    course_limit = np.zeros(n_courses, np.int64)
+    course_has_limit = np.zeros(n_courses, np.bool_)
+    tie_subjects = {}
+    tie_ptr = np.zeros(n_courses + 1, np.int64)
+    tie_cols = []
+    for c, info in enumerate(course_data.values()):
+        group = info.get('group')
+        if group and pd.notna(group):
+            course_group[c] = group_id[group]
+            limit = _int_or_none(info.get('group_constraint'))
+            if limit is not None:
+                course_limit[c], course_has_limit[c] = limit, True
+        else:
+            cap = _int_or_none(info.get('capacity'))
+            if cap is not None:
+                course_cap[c], course_has_cap[c] = cap, True
+        for subject in info.get('tiebreaker_subjects', []):
+            tie_cols.append(tie_subjects.setdefault(subject, len(tie_subjects)))
+        tie_ptr[c + 1] = len(tie_cols)
+
+    group_ptr = np.zeros(len(group_to_courses) + 1, np.int64)
+    group_courses = []
+    for g, courses in enumerate(group_to_courses.values()):
+        group_courses.extend(course_id[course] for course in courses)
+        group_ptr[g + 1] = len(group_courses)
+
+    # _safe_tie_score of every student's tiebreaker marks
+    tie_vals = np.empty((n, len(tie_subjects)), np.float64)
+    for subject, j in tie_subjects.items():
+        tie_vals[:, j] = [_to_num(student_marks[name].get(subject)) for name in names]
+    tie_vals[np.isnan(tie_vals)] = -np.inf
+
+    head, nxt, touch_order, assigned, assign_seq, ev_student, ev_alive = _da_kernel(
+        # copy: pd.to_numeric can hand back a read-only array, which numba
+        # would compile a second specialisation for
+        feasible, pref_course, np.array(student_table['total_score'], np.float64), course_group,
+        course_cap, course_has_cap, course_limit, course_has_limit,
+        group_ptr, np.array(group_courses, np.int64),
+        tie_ptr, np.array(tie_cols, np.int64), tie_vals,
+    )
+
+    course_matches = {}
+    for c in touch_order:
+        roster = []
+        m = head[c]
+        while m != -1:
+            roster.append(names[m])
+            m = nxt[m]
+        course_matches[course_names[c]] = roster
+    unplaced_students = [names[i] for i in ev_student[ev_alive]]
+    placed = np.flatnonzero(assigned >= 0)
+    placed = placed[np.argsort(assign_seq[placed], kind='stable')]
+    student_course_assignment = {names[i]: course_names[assigned[i]] for i in placed}
+    return course_matches, unplaced_students, student_course_assignment
+
+
+def last_ranked_students(course_data, course_matches, student_marks):
+    """
+    The posted student with the lowest Total Score for every course in
+    course_data (same order), or None where nobody was posted. Ties go to
+    the earliest student on the roster, as with min().
+    """
+    # Non-numeric totals (e.g. 'ABS') are compared as NaN, so a course whose
+    # roster mixes them with numbers does not raise; a NaN only wins when it
+    # comes first, as with min() on floats
+    posted = [student for students in course_matches.values() for student in students]
+    total_scores = dict(zip(
+        posted,
+        _to_num_array(student_marks[student]['Total Score'] for student in posted),
+    ))
+    return [
+        min(course_matches[course], key=total_scores.__getitem__)
+        if course_matches.get(course) else None
+        for course in course_data
+    ]
+
+
+def warm_up_da_kernel():
+    """Compile (or load from cache) _da_kernel with a one-student input."""
+    if not _HAVE_NUMBA:
+        return
+    _da_kernel(
+        np.ones((1, 1), np.bool_), np.zeros((1, 1), np.int64), np.zeros(1, np.float64),
+        np.zeros(1, np.int64), np.zeros(1, np.int64), np.zeros(1, np.bool_),
+        np.ones(1, np.int64), np.ones(1, np.bool_),
+        np.array([0, 1], np.int64), np.zeros(1, np.int64),
+        np.array([0, 1], np.int64), np.zeros(1, np.int64), np.zeros((1, 1), np.float64),
+    )
+
+
+def deferred_acceptance_with_displacement(student_marks, course_data, num_preferences, student_preferences):
+    course_matches = {}  # Course to roster (ordered set of students)
+    student_course_assignment = {}  # Track which course each student is placed in
+    group_capacity_tracker = {}  # Live count of students placed in each group
+    unplaced_students = UnplacedStudents()
+    displaced_students_queue = deque()  # Queue for displaced students
+    preference_tracker = {}  # Tracks each student's last attempted preference
+
+    # Column-oriented student data; subject criteria never change during the
+    # run, so evaluate them once
+    criteria_subjects = sorted({subject for info in course_data.values() for subject in info.get('subject_criteria', {})})
+    student_table = build_student_table(student_marks, student_preferences, num_preferences, criteria_subjects)
+    student_id = student_table['student_id']
+    preferences = student_table['preferences']
+    eligible = build_course_eligibility(student_table, course_data)
+    feasible = build_feasible_preferences(student_table, eligible)
+    group_to_courses, course_to_group = build_group_index(course_data)
+    group_merit = new_group_merit_index(group_to_courses)
+    tiebreak_cache = {}
+
+    if _HAVE_NUMBA and not logger.isEnabledFor(logging.DEBUG):
+        # Compiled loop (no per-attempt trace); the Python loop below is the
+        # reference and runs when DEBUG logging is on
+        course_matches, unplaced_students, student_course_assignment = run_compiled_da(
+            student_marks, course_data, student_table, feasible, group_to_courses
+        )
+    else:
+        # Queue for students and their current preference being processed
+        students_to_process = deque([(student, 1) for student in student_marks.keys()])
+
+        while students_to_process or displaced_students_queue:
+            if displaced_students_queue:
+                # Prioritize displaced students
+                current_student, current_preference = displaced_students_queue.popleft()
+            else:
+                # Process new students if no displaced students
+                current_student, current_preference = students_to_process.popleft()
+
+            # Update preference_tracker for accurate tracking
+            preference_tracker[current_student] = current_preference
+
+            # Check if the student has exhausted all preferences
+            if current_preference > num_preferences:
+                logger.debug("Student %s has exhausted all preferences.", current_student)
+                unplaced_students.append(current_student)
+                continue
+
+            # Process the student's current preference
+            sid = student_id[current_student]
+            preferred_course = preferences[sid, current_preference - 1]
+
+            if not preferred_course or not feasible[sid, current_preference - 1]:
+                # Move to the next preference if none is listed, the course is
+                # unknown or the criteria are not met. Going to the back of the
+                # queue (rather than straight on) keeps first-come-first-served
+                # courses filling in the same order.
+                if preferred_course:
+                    logger.debug("Student %s cannot be placed in %s (unknown course or criteria not met).", current_student, preferred_course)
+                students_to_process.append((current_student, current_preference + 1))
+                continue
+
+            # Attempt to place the student
+            logger.debug("Processing %s for preference %s: %s", current_student, current_preference, preferred_course)
+            result = try_place_student_in_course(
+                current_student, student_marks, preferred_course,
+                course_data, course_matches, student_course_assignment,
+                group_capacity_tracker, unplaced_students,
+                eligible=eligible, student_table=student_table,
+                group_to_courses=group_to_courses, course_to_group=course_to_group,
+                group_merit=group_merit, tiebreak_cache=tiebreak_cache,
+            )
+
+            if result is True:
+                # Successful placement; try_place_student_in_course already
+                # updated course_matches / student_course_assignment
+                assert student_course_assignment[current_student] == preferred_course
+                logger.debug("%s placed in %s", current_student, preferred_course)
+
+            elif isinstance(result, str):
+                # A student was displaced; use preference_tracker to accurately queue them for the next preference
+                displaced_student = result
+                next_preference = preference_tracker[displaced_student] + 1
+                logger.debug("Displaced student %s re-added to queue for next preference: %s", displaced_student, next_preference)
+                displaced_students_queue.append((displaced_student, next_preference))
+            else:
+                # Student was not placed; try the next preference
+                students_to_process.append((current_student, current_preference + 1))
+
+        # Hand rosters and unplaced_students back as lists, in placement order
+        course_matches = {course: list(roster) for course, roster in course_matches.items()}
+        unplaced_students = list(unplaced_students)
+
+    logger.info(
+        "Deferred acceptance finished: %s students placed, %s not placed.",
+        len(student_course_assignment), len(student_marks) - len(student_course_assignment),
+    )
 
     return course_matches, unplaced_students, student_course_assignment
 
@@ -414,20 +1021,22 @@ def deferred_acceptance_with_displacement(student_marks, course_data, num_prefer
 
 def create_course_report(course_data, course_matches, student_marks, output_folder_path):
     course_report = []
+    last_ranked = last_ranked_students(course_data, course_matches, student_marks)
+    posted_counts = {course: len(students) for course, students in course_matches.items()}
 
-    for course_name, course_info in course_data.items():
+    for (course_name, course_info), last_ranked_student in zip(course_data.items(), last_ranked):
         original_vacancies = course_info['capacity']
-        assigned_students = course_matches.get(course_name, [])
-        remaining_vacancies = original_vacancies - len(assigned_students)
-        num_students_posted = len(assigned_students)
-
-        if num_students_posted > 0:
-            last_ranked_student = min(assigned_students, key=lambda student: student_marks[student]['Total Score'])
-            last_ranked_student_scores = [student_marks[last_ranked_student][subject] for subject in course_info['subject_criteria'].keys()]
-            last_ranked_student_total_score = student_marks[last_ranked_student]['Total Score']
+        num_students_posted = posted_counts.get(course_name, 0)
+        remaining_vacancies = original_vacancies - num_students_posted
+        subjects = tuple(course_info['subject_criteria'])
+
+        if last_ranked_student is not None:
+            last_marks = student_marks[last_ranked_student]
+            last_ranked_student_scores = [last_marks[subject] for subject in subjects]
+            last_ranked_student_total_score = last_marks['Total Score']
         else:
             last_ranked_student = "N/A"
-            last_ranked_student_scores = ["N/A"] * len(course_info['subject_criteria'])
+            last_ranked_student_scores = ["N/A"] * len(subjects)
             last_ranked_student_total_score = "N/A"
 
         course_report.append({
@@ -436,50 +1045,44 @@ def create_course_report(course_data, course_matches, student_marks, output_fold
             'Remaining Vacancies': remaining_vacancies,
             'Number of students posted': num_students_posted,
             'Last Ranked Student Posted': last_ranked_student,
-            **{f'Last Ranked Student {subject} Score': score for subject, score in zip(course_info['subject_criteria'].keys(), last_ranked_student_scores)},
+            **{f'Last Ranked Student {subject} Score': score for subject, score in zip(subjects, last_ranked_student_scores)},
             'Last Ranked Student Overall Score': last_ranked_student_total_score
         })
 
     course_report_df = pd.DataFrame(course_report)
     course_report_output_file_path = os.path.join(output_folder_path, 'course_report.xlsx')
-    with pd.ExcelWriter(course_report_output_file_path) as writer:
+    with pd.ExcelWriter(course_report_output_file_path, engine=_EXCEL_WRITER_ENGINE) as writer:
         course_report_df.to_excel(writer, sheet_name='Course Report', index=False)
 
     print(f"Course report saved to {course_report_output_file_path}")
 
 
-def create_unplaced_students_report(unplaced_students, student_marks, num_preferences, output_folder_path, student_course_assignment):
+def create_unplaced_students_report(unplaced_students, student_marks, student_preferences, num_preferences, output_folder_path, student_course_assignment):
     """
     Creates a report of unplaced students who have exhausted all their preferences.
     """
-    unplaced_students_list = []
-
-    for student in unplaced_students:
-        # Skip students who were successfully placed
-        if student in student_course_assignment:
-            continue
-
-        if student not in student_marks:
-            continue  # Skip if the student has no recorded marks (this can avoid errors)
-            
-        student_data = student_marks[student].copy()
-        student_data['Student Name'] = student
-        student_data['Reason for not being placed'] = "No available courses in preferences"
-        unplaced_students_list.append(student_data)
+    # Skip students who were successfully placed, and any without recorded
+    # marks (this can avoid errors)
+    unplaced_names = [
+        student for student in unplaced_students
+        if student not in student_course_assignment and student in student_marks
+    ]
 
     # Check if the unplaced students list is empty
-    if not unplaced_students_list:
+    if not unplaced_names:
         print("No unplaced students found.")
         return  # If no unplaced students, don't generate the report
 
-    # Create a DataFrame with the required columns
-    unplaced_students_column_order = ['Student Name', 'Reason for not being placed'] + [f'Preference {i}' for i in range(1, num_preferences + 1)]
-
-    unplaced_students_df = pd.DataFrame(unplaced_students_list, columns=unplaced_students_column_order)
+    # Build the report column by column
+    unplaced_students_df = pd.DataFrame({
+        'Student Name': unplaced_names,
+        'Reason for not being placed': ["No available courses in preferences"] * len(unplaced_names),
+        **preference_columns(unplaced_names, student_preferences, num_preferences),
+    })
     unplaced_students_report_path = os.path.join(output_folder_path, 'unplaced_students_report.xlsx')
     
     # Save the DataFrame to Excel
-    with pd.ExcelWriter(unplaced_students_report_path) as writer:
+    with pd.ExcelWriter(unplaced_students_report_path, engine=_EXCEL_WRITER_ENGINE) as writer:
         unplaced_students_df.to_excel(writer, sheet_name='Unplaced Students Report', index=False)
 
     print(f"Unplaced students report saved to {unplaced_students_report_path}")
@@ -523,7 +1126,6 @@ def run_matching_algorithm():
             for s in self._streams:
                 try:
                     s.write(data)
-                    s.flush()
                 except Exception:
                     pass
         def flush(self):
@@ -533,12 +1135,19 @@ def run_matching_algorithm():
                 except Exception:
                     pass
 
+    # The log file is block-buffered; phase messages below flush it, so the
+    # file is current up to the phase that is running
     original_stdout = sys.stdout
     original_stderr = sys.stderr
-    log_fh = open(log_file_path, "w", encoding="utf-8", buffering=1)
+    log_fh = open(log_file_path, "w", encoding="utf-8")
     sys.stdout = _Tee(original_stdout, log_fh)
     sys.stderr = _Tee(original_stderr, log_fh)
 
+    # Send the matcher's log records through the tee as well
+    log_handler = logging.StreamHandler(sys.stdout)
+    log_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(log_handler)
+
     print(f"\n=== Deferred Acceptance Matching Log Started {datetime.now()} ===")
     print(f"Student Data: {student_data_path}")
     print(f"Course Data:  {course_data_path}")
@@ -546,10 +1155,10 @@ def run_matching_algorithm():
 
     try:
         # -------------- Read inputs --------------
-        print("Reading student data...")
-        student_marks, num_preferences = read_student_data(student_data_path)
+        print("Reading student data...", flush=True)
+        student_marks, num_preferences, student_preferences = read_student_data(student_data_path)
 
-        print("Reading course data...")
+        print("Reading course data...", flush=True)
         course_data = read_course_data(course_data_path)
 
         # Initialize course_matches for all courses with empty lists
@@ -557,14 +1166,15 @@ def run_matching_algorithm():
         course_matches = {course_name: [] for course_name in course_data.keys()}
 
         # -------------- Run the core algorithm --------------
-        print("Running deferred acceptance with displacement...")
+        print("Running deferred acceptance with displacement...", flush=True)
         course_matches, unplaced_students, student_course_assignment = deferred_acceptance_with_displacement(
-            student_marks, course_data, num_preferences
+            student_marks, course_data, num_preferences, student_preferences
         )
 
         # -------------- Build per-student assignment table --------------
-        print("Assembling per-student assignment table...")
-        student_assignments = []
+        print("Assembling per-student assignment table...", flush=True)
+        assigned_names = []
+        assigned_courses = []
         placed_students = set()
 
         for course, students in course_matches.items():
@@ -574,27 +1184,21 @@ def run_matching_algorithm():
                     continue
                 placed_students.add(student)
 
-                sdata = student_marks.get(student)
-                if not sdata:
+                if not student_marks.get(student):
                     print(f"ERROR: Student {student} not found in student_marks!")
                     continue
 
-                record = sdata.copy()
-                record["Student Name"] = student
-                record["Assigned Course"] = course
-                student_assignments.append(record)
+                assigned_names.append(student)
+                assigned_courses.append(course)
                 print(f"DEBUG: Added student {student} to the assignment for course {course}")
 
-        # Ordered columns for output (missing keys will show as NaN)
-        pref_cols = [f"Preference {i}" for i in range(1, num_preferences + 1)]
-        column_order = ["Student Name", "Assigned Course"] + pref_cols + ["Total Score"]
-
-        results_df = pd.DataFrame(student_assignments)
-        # Ensure we include all desired columns (add missing ones, preserve order)
-        for col in column_order:
-            if col not in results_df.columns:
-                results_df[col] = pd.NA
-        results_df = results_df[column_order]
+        # Ordered columns for output, built column by column
+        results_df = pd.DataFrame({
+            "Student Name": assigned_names,
+            "Assigned Course": assigned_courses,
+            **preference_columns(assigned_names, student_preferences, num_preferences),
+            "Total Score": [student_marks[student].get("Total Score") for student in assigned_names],
+        })
 
         # -------------- Consistency checks --------------
         all_students_in_matches = {stu for lst in course_matches.values() for stu in lst}
@@ -608,12 +1212,12 @@ def run_matching_algorithm():
 
         # -------------- Save outputs --------------
         output_file_path = os.path.join(output_folder_path, "outputmatchingresults.xlsx")
-        print(f"Writing student assignments to: {output_file_path}")
-        results_df.to_excel(output_file_path, index=False)
+        print(f"Writing student assignments to: {output_file_path}", flush=True)
+        results_df.to_excel(output_file_path, index=False, engine=_EXCEL_WRITER_ENGINE)
 
-        print("Creating course and unplaced student reports...")
+        print("Creating course and unplaced student reports...", flush=True)
         create_course_report(course_data, course_matches, student_marks, output_folder_path)
-        create_unplaced_students_report(unplaced_students, student_marks, num_preferences, output_folder_path, student_course_assignment)
+        create_unplaced_students_report(unplaced_students, student_marks, student_preferences, num_preferences, output_folder_path, student_course_assignment)
 
         print("\n=== Matching completed successfully ===")
         print(f"Files created in: {output_folder_path}")
@@ -632,6 +1236,7 @@ def run_matching_algorithm():
     finally:
         # Restore console streams and close file handle
         try:
+            logger.removeHandler(log_handler)
             sys.stdout = original_stdout
             sys.stderr = original_stderr
             log_fh.close()
@@ -1,34 +1,51 @@
 import os
 import sys
 import io
+import logging
 import pandas as pd
 import numpy as np
 
+try:
+    from rustpy_xlsxwriter import FastExcel
+except ImportError:  # rustpy-xlsxwriter not installed: use pandas' to_excel
+    FastExcel = None
+
 from deferred_acceptance_with_displacement_final4 import (
     read_student_data,
     read_course_data,
+    preference_columns,
     deferred_acceptance_with_displacement,
+    last_ranked_students,
+    warm_up_da_kernel,
+    logger as da_logger,
+    _EXCEL_WRITER_ENGINE,
 )
 
 # ------------------------------------------------------------
-# JSON CLEANING HELPER  (Infinity / NaN -> JSON-safe)
+# EXCEL OUTPUT
 # ------------------------------------------------------------
-def _clean_df_for_json(df: pd.DataFrame) -> pd.DataFrame:
+def _write_xlsx(df: pd.DataFrame, path: str):
     """
-    Convert DataFrame values into JSON-safe values:
-    - NaN / NA  -> None
-    - +inf / -inf -> None   (frontend interprets None in vacancy columns as "No limit")
+    Write df as a one-sheet workbook, like df.to_excel(path, index=False)
+    (bold header, no autofit), with the Rust writer when available (which
+    streams rows to disk) and otherwise pandas with xlsxwriter if installed.
+    NaN / None / +-inf are all written as empty cells.
     """
-    if df is None or df.empty:
-        return df
-
-    # Convert unlimited values (Infinity) into JSON null
-    df = df.replace([np.inf, -np.inf], None)
+    if FastExcel is None:
+        df.to_excel(path, index=False, inf_rep="", engine=_EXCEL_WRITER_ENGINE)
+    else:
+        FastExcel(path, autofit=False).format(bold_headers=True).sheet("Sheet1", df).save()
 
-    # Convert NaN / NA -> JSON null
-    df = df.where(pd.notnull(df), None)
 
-    return df
+# ------------------------------------------------------------
+# NUMBA WARM-UP
+# ------------------------------------------------------------
+def warm_up_kernels():
+    """
+    Compile (or load from cache) the numba kernels with tiny inputs,
+    so the first real request does not pay the compile cost.
+    """
+    warm_up_da_kernel()
 
 
 # ------------------------------------------------------------
@@ -38,31 +55,46 @@ def run_matching_core(
     student_data_path: str,
     course_data_path: str,
     output_folder_path: str,
+    verbose: bool = False,
+    save_excel: bool = True,
+    serialize: bool = False,
 ):
     """
     This function:
     - loads student & course Excel files
     - runs the matching algorithm
     - builds 3 report DataFrames
-    - saves Excel files to output folder
-    - returns JSON-safe dict for frontend
-    - CAPTURES all console prints into log_text
+    - saves Excel files to output folder (skipped when save_excel=False,
+      for callers that build their own workbooks; output_files are then None)
+    - returns the 3 DataFrames as-is (NaN / +-inf included) so callers only
+      convert what they need; with serialize=True also their row dicts
+      (to_dict(orient="records")) under "students" / "course_report" /
+      "unplaced", ready for orjson
+    - CAPTURES all console prints and "da" log records into log_text
+      (the per-attempt trace is only logged when verbose=True)
     """
 
     # Ensure output folder exists
-    os.makedirs(output_folder_path, exist_ok=True)
+    if save_excel:
+        os.makedirs(output_folder_path, exist_ok=True)
 
     # --- capture all console output into a buffer ---
     log_buffer = io.StringIO()
     old_stdout = sys.stdout
+    log_handler = logging.StreamHandler(log_buffer)
+    log_handler.setFormatter(logging.Formatter("%(message)s"))
+    old_level = da_logger.level
 
     try:
         sys.stdout = log_buffer
+        da_logger.addHandler(log_handler)
+        if verbose:
+            da_logger.setLevel(logging.DEBUG)
 
         # ----------------------------------------
         # LOAD INPUT FILES
         # ----------------------------------------
-        student_marks, num_preferences = read_student_data(student_data_path)
+        student_marks, num_preferences, student_preferences = read_student_data(student_data_path)
         course_data = read_course_data(course_data_path)
 
         # ----------------------------------------
@@ -70,138 +102,127 @@ def run_matching_core(
         # (all prints inside here are captured)
         # ----------------------------------------
         course_matches, unplaced_students, student_course_assignment = (
-            deferred_acceptance_with_displacement(student_marks, course_data, num_preferences)
+            deferred_acceptance_with_displacement(
+                student_marks, course_data, num_preferences, student_preferences
+            )
         )
 
         # ------------------------------------------------------------
         # BUILD STUDENT PLACEMENT DATAFRAME
         # ------------------------------------------------------------
-        student_assignments = []
-        placed_students = set()
         pref_cols = [f"Preference {i}" for i in range(1, num_preferences + 1)]
-
-        for course, students in course_matches.items():
-            for student in students:
-                if student in placed_students:
-                    continue
-
-                placed_students.add(student)
-
-                sdata = student_marks.get(student)
-                if not sdata:
-                    continue
-
-                entry = sdata.copy()
-                entry["Student Name"] = student
-                entry["Assigned Course"] = course
-                student_assignments.append(entry)
-
         column_order = ["Student Name", "Assigned Course"] + pref_cols + ["Total Score"]
 
-        results_df = pd.DataFrame(student_assignments)
-
-        # Ensure all required columns exist
-        for col in column_order:
-            if col not in results_df.columns:
-                results_df[col] = pd.NA
+        # One record per placed student, in roster order, holding only the
+        # report columns. student_course_assignment is authoritative: a
+        # student is listed under the course it names (so at most once) and
+        # students without marks are left out
+        student_assignments = [
+            {
+                "Student Name": student,
+                "Assigned Course": course,
+                **dict(zip(pref_cols, student_preferences.get(student, ()))),
+                "Total Score": student_marks[student].get("Total Score"),
+            }
+            for course, students in course_matches.items()
+            for student in students
+            if student_course_assignment.get(student) == course
+            and student_marks.get(student)
+        ]
 
-        results_df = results_df[column_order]
+        # columns= fixes the schema and order; missing columns come out empty
+        results_df = pd.DataFrame.from_records(student_assignments, columns=column_order)
 
         # ------------------------------------------------------------
         # COURSE REPORT
         # ------------------------------------------------------------
-        report_rows = []
-
-        for course_name, info in course_data.items():
-            original_vacancies = info["capacity"]  # may be inf if unlimited
-            assigned_students = course_matches.get(course_name, [])
-            remaining_vacancies = original_vacancies - len(assigned_students)
-
-            if len(assigned_students) > 0:
-                # Lowest total score among those placed
-                last_student = min(
-                    assigned_students,
-                    key=lambda stu: student_marks[stu]["Total Score"]
-                )
-                last_total = student_marks[last_student]["Total Score"]
-                last_subject_scores = [
-                    student_marks[last_student].get(subject, "N/A")
-                    for subject in info["subject_criteria"].keys()
-                ]
-            else:
-                last_student = "N/A"
-                last_total = "N/A"
-                last_subject_scores = ["N/A"] * len(info["subject_criteria"])
-
-            row = {
-                "Course Name": course_name,
-                "Original Vacancies": original_vacancies,
-                "Remaining Vacancies": remaining_vacancies,
-                "Number of students posted": len(assigned_students),
-                "Last Ranked Student Posted": last_student,
-                "Last Ranked Student Overall Score": last_total,
-            }
-
-            # subject_criteria columns
-            for subject, score in zip(info["subject_criteria"].keys(), last_subject_scores):
-                row[f"Last Ranked Student {subject} Score"] = score
-
-            report_rows.append(row)
+        # One entry per course; "N/A" where nobody was posted
+        capacities = [info["capacity"] for info in course_data.values()]  # may be inf
+        posted_counts = {course: len(students) for course, students in course_matches.items()}
+        num_posted = [posted_counts.get(name, 0) for name in course_data]
+        last_ranked = last_ranked_students(course_data, course_matches, student_marks)
+        last_students = [student if student is not None else "N/A" for student in last_ranked]
+        last_marks = [
+            student_marks[student] if student is not None else None
+            for student in last_ranked
+        ]
+
+        report_columns = {
+            "Course Name": list(course_data),
+            "Original Vacancies": capacities,
+            "Remaining Vacancies": np.subtract(capacities, num_posted),
+            "Number of students posted": num_posted,
+            "Last Ranked Student Posted": last_students,
+            "Last Ranked Student Overall Score": [
+                marks["Total Score"] if marks is not None else "N/A"
+                for marks in last_marks
+            ],
+        }
+
+        # subject_criteria columns, in first-seen order across courses; empty
+        # for courses that do not list the subject
+        all_subjects = dict.fromkeys(
+            subject for info in course_data.values() for subject in info["subject_criteria"]
+        )
+        for subject in all_subjects:
+            report_columns[f"Last Ranked Student {subject} Score"] = [
+                np.nan if subject not in info["subject_criteria"]
+                else "N/A" if marks is None
+                else marks.get(subject, "N/A")
+                for info, marks in zip(course_data.values(), last_marks)
+            ]
 
-        course_report_df = pd.DataFrame(report_rows)
+        course_report_df = pd.DataFrame(report_columns)
 
         # ------------------------------------------------------------
         # UNPLACED STUDENTS
         # ------------------------------------------------------------
-        unplaced_list = []
-
-        for student in unplaced_students:
-            if student not in student_marks:
-                continue
-
-            sdata = student_marks[student].copy()
-            sdata["Student Name"] = student
-            sdata["Reason for not being placed"] = "No available courses in preferences"
-
-            unplaced_list.append(sdata)
-
-        unplaced_students_df = pd.DataFrame(unplaced_list)
-
-        # ------------------------------------------------------------
-        # CLEAN FOR JSON (Infinity/NaN -> None)
-        # ------------------------------------------------------------
-        results_df = _clean_df_for_json(results_df)
-        course_report_df = _clean_df_for_json(course_report_df)
-        unplaced_students_df = _clean_df_for_json(unplaced_students_df)
+        # Students without marks are left out; every student has the same
+        # mark keys, so the columns come from the first one
+        unplaced_names = [student for student in unplaced_students if student in student_marks]
+
+        if unplaced_names:
+            unplaced_students_df = pd.DataFrame({
+                **{
+                    key: [student_marks[student][key] for student in unplaced_names]
+                    for key in student_marks[unplaced_names[0]]
+                },
+                **preference_columns(unplaced_names, student_preferences, num_preferences),
+                "Student Name": unplaced_names,
+                "Reason for not being placed": "No available courses in preferences",
+            })
+        else:
+            unplaced_students_df = pd.DataFrame()
 
         # ------------------------------------------------------------
         # SAVE OUTPUT EXCEL FILES (for your own reference if needed)
         # ------------------------------------------------------------
-        students_xlsx = os.path.join(output_folder_path, "outputmatchingresults.xlsx")
-        course_xlsx = os.path.join(output_folder_path, "course_report.xlsx")
-        unplaced_xlsx = os.path.join(output_folder_path, "unplaced_students_report.xlsx")
-
-        results_df.to_excel(students_xlsx, index=False)
-        course_report_df.to_excel(course_xlsx, index=False)
-        if not unplaced_students_df.empty:
-            unplaced_students_df.to_excel(unplaced_xlsx, index=False)
-        else:
-            unplaced_xlsx = None
+        students_xlsx = course_xlsx = unplaced_xlsx = None
+        if save_excel:
+            students_xlsx = os.path.join(output_folder_path, "outputmatchingresults.xlsx")
+            course_xlsx = os.path.join(output_folder_path, "course_report.xlsx")
+            _write_xlsx(results_df, students_xlsx)
+            _write_xlsx(course_report_df, course_xlsx)
+            if not unplaced_students_df.empty:
+                unplaced_xlsx = os.path.join(output_folder_path, "unplaced_students_report.xlsx")
+                _write_xlsx(unplaced_students_df, unplaced_xlsx)
 
     finally:
-        # restore stdout no matter what
+        # restore stdout and the logger no matter what
         sys.stdout = old_stdout
+        da_logger.removeHandler(log_handler)
+        da_logger.setLevel(old_level)
 
     # get the full console log text
     log_text = log_buffer.getvalue()
 
     # ------------------------------------------------------------
-    # RETURN JSON DATA FOR FRONTEND (including exact console log)
+    # RETURN REPORT DATA FOR FRONTEND (including exact console log)
     # ------------------------------------------------------------
-    return {
-        "students": results_df.to_dict(orient="records"),
-        "course_report": course_report_df.to_dict(orient="records"),
-        "unplaced": unplaced_students_df.to_dict(orient="records"),
+    result = {
+        "students_df": results_df,
+        "course_report_df": course_report_df,
+        "unplaced_df": unplaced_students_df,
         "output_files": {
             "students": students_xlsx,
             "course_report": course_xlsx,
@@ -209,3 +230,8 @@ def run_matching_core(
         },
         "log_text": log_text,
     }
+    if serialize:
+        result["students"] = results_df.to_dict(orient="records")
+        result["course_report"] = course_report_df.to_dict(orient="records")
+        result["unplaced"] = unplaced_students_df.to_dict(orient="records")
+    return result
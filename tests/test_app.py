@@ -0,0 +1,81 @@
+import io
+import unittest
+from unittest import mock
+
+import orjson
+import pandas as pd
+
+import app as app_module
+from app import app
+
+
+def _xlsx(frame):
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+class RunMatchingDateColumnTest(unittest.TestCase):
+    """A date column in the marks must not break the JSON responses."""
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.students = pd.DataFrame(
+            {
+                "Student Name": ["S1", "S2", "S3"],
+                "Preference 1": ["Art", "Art", "Art"],
+                "Math": [50, 60, 70],
+                "Registered": pd.to_datetime(["2024-01-06 00:00:00", "2024-01-07 13:45:10", None]),
+                "Total Score": [70, 60, 50],
+            }
+        )
+        self.courses = pd.DataFrame(
+            {
+                "Course Name": ["Art"],
+                "Capacity": [1],
+                "Group": [None],
+                "Group Constraint": [None],
+                "Tiebreaker Subjects": [None],
+                "Math": [None],
+            }
+        )
+
+    def _post(self, url):
+        return self.client.post(
+            url,
+            data={
+                "student_file": (_xlsx(self.students), "students.xlsx"),
+                "course_file": (_xlsx(self.courses), "courses.xlsx"),
+            },
+            content_type="multipart/form-data",
+        )
+
+    def test_run_matching(self):
+        response = self._post("/api/run-matching")
+        self.assertEqual(response.status_code, 200)
+        unplaced = {row["Student Name"]: row for row in orjson.loads(response.get_data())["unplaced"]}
+        self.assertEqual(unplaced["S2"]["Registered"], "Sun, 07 Jan 2024 13:45:10 GMT")
+        self.assertIsNone(unplaced["S3"]["Registered"])
+
+    def test_run_matching_multipart(self):
+        response = self._post("/api/run-matching-multipart")
+        self.assertEqual(response.status_code, 200)
+        boundary = response.mimetype_params["boundary"].encode()
+        parts = response.get_data().split(b"--" + boundary)
+        self.assertEqual(parts[-1], b"--\r\n")
+        metadata = orjson.loads(parts[1].split(b"\r\n\r\n", 1)[1])
+        self.assertEqual(metadata["excel_files"], ["students_xlsx", "course_report_xlsx", "unplaced_xlsx"])
+        unplaced = {row["Student Name"]: row for row in metadata["unplaced"]}
+        self.assertEqual(unplaced["S2"]["Registered"], "Sun, 07 Jan 2024 13:45:10 GMT")
+
+    def test_run_matching_multipart_encode_error(self):
+        # Must fail before the 200 goes out, not part way through the body
+        with mock.patch.object(app_module, "_json_default", side_effect=TypeError):
+            response = self._post("/api/run-matching-multipart")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(orjson.loads(response.get_data())["error"], "Internal server error")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import random
+import unittest
+from unittest import mock
+
+import deferred_acceptance_with_displacement_final4 as da
+
+SUBJECTS = ["Math", "Science", "English", "History"]
+
+
+def random_inputs(seed, tie_heavy=False):
+    """
+    Random student / course inputs covering the awkward cases: grouped and
+    ungrouped courses (NaN / blank group names), odd capacities and group
+    constraints, unknown tiebreaker subjects, non-numeric marks and totals,
+    and preferences naming unknown or blank courses.
+    """
+    rng = random.Random(seed)
+    course_names = [f"C{i}" for i in range(rng.randint(1, 7))]
+
+    course_data = {}
+    for name in course_names:
+        criteria = {
+            subject: (rng.choice([">=", "<="]), rng.randint(20, 80))
+            for subject in SUBJECTS
+            if rng.random() < 0.3
+        }
+        course_data[name] = {
+            "capacity": rng.choice([rng.randint(0, 8), float("inf"), None, "3", "x", 2.7]),
+            "subject_criteria": criteria,
+            "group": rng.choice(["G1", "G2", None, float("nan"), ""]),
+            "group_constraint": rng.choice([rng.randint(0, 10), None, float("nan"), "4"]),
+            "tiebreaker_subjects": rng.sample(SUBJECTS + ["Unknown"], rng.randint(0, 3)),
+        }
+
+    num_preferences = rng.randint(0, 4)
+    student_marks, student_preferences = {}, {}
+    for i in range(rng.randint(0, 60)):
+        marks = {
+            subject: rng.choice([rng.randint(0, 4) * 25, "VR", None, float("nan"), rng.randint(0, 100)])
+            for subject in SUBJECTS
+        }
+        if tie_heavy:
+            total = rng.choice([50, 50, 50, 60, float("nan")])
+        else:
+            total = rng.choice([rng.randint(0, 5) * 10] * 3 + [float("nan"), "ABS"])
+        marks["Total Score"] = total
+        marks["Overall Score"] = total
+        student_marks[f"S{i}"] = marks
+        student_preferences[f"S{i}"] = tuple(
+            rng.choice(course_names + ["Unknown", ""]) for _ in range(num_preferences)
+        )
+    return student_marks, course_data, num_preferences, student_preferences
+
+
+def as_comparable(result):
+    course_matches, unplaced_students, student_course_assignment = result
+    # Key order matters too: it drives the report row order
+    return (
+        list(course_matches.items()),
+        list(unplaced_students),
+        list(student_course_assignment.items()),
+    )
+
+
+@unittest.skipUnless(da._HAVE_NUMBA, "numba not installed")
+class CompiledDATest(unittest.TestCase):
+    """_da_kernel must give exactly what the Python DA loop gives."""
+
+    def check_seeds(self, seeds, tie_heavy=False):
+        for seed in seeds:
+            with self.subTest(seed=seed, tie_heavy=tie_heavy):
+                inputs = random_inputs(seed, tie_heavy)
+                with mock.patch.object(da, "_HAVE_NUMBA", False):
+                    expected = da.deferred_acceptance_with_displacement(*inputs)
+                compiled = da.deferred_acceptance_with_displacement(*inputs)
+                self.assertEqual(as_comparable(compiled), as_comparable(expected))
+
+    def test_random_inputs(self):
+        self.check_seeds(range(500))
+
+    def test_random_inputs_with_ties(self):
+        self.check_seeds(range(500), tie_heavy=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import io
+import unittest
+from datetime import date, datetime
+
+import openpyxl
+import pandas as pd
+
+from app import fast_xlsx
+
+
+class FastXlsxTest(unittest.TestCase):
+    def test_xml_illegal_characters_are_dropped(self):
+        rows = [{"Name": "a\x0bb\x00c", "Note": "tab\tand\nnewline", "Score": 70}]
+        book = openpyxl.load_workbook(io.BytesIO(fast_xlsx(rows, list(rows[0]))))
+        self.assertEqual(
+            [cell.value for cell in book.active[2]],
+            ["abc", "tab\tand\nnewline", 70],
+        )
+
+    def test_dates_are_date_cells(self):
+        rows = [
+            {
+                "Timestamp": pd.Timestamp("2024-01-07 13:45:10"),
+                "Date": date(2024, 2, 29),
+                "Missing": pd.NaT,
+            }
+        ]
+        book = openpyxl.load_workbook(io.BytesIO(fast_xlsx(rows, list(rows[0]))))
+        cells = book.active[2]
+        self.assertEqual(
+            [cell.value for cell in cells],
+            [datetime(2024, 1, 7, 13, 45, 10), datetime(2024, 2, 29), None],
+        )
+        self.assertEqual(cells[0].number_format, "YYYY-MM-DD HH:MM:SS")
+        self.assertEqual(cells[1].number_format, "YYYY-MM-DD")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from deferred_acceptance_with_displacement_final4 import (
+    create_course_report,
+    last_ranked_students,
+)
+from matcher_core import run_matching_core
+
+
+def _course(capacity):
+    return {
+        "capacity": capacity,
+        "group": None,
+        "group_constraint": None,
+        "subject_criteria": {},
+        "tiebreaker_subjects": [],
+    }
+
+
+class LastRankedStudentsTest(unittest.TestCase):
+    def test_lowest_total_and_ties_go_to_earliest(self):
+        course_data = {"Art": _course(5), "Music": _course(5), "Lit": _course(5)}
+        course_matches = {"Art": ["A", "B", "C"], "Music": ["D"]}
+        student_marks = {
+            "A": {"Total Score": 70},
+            "B": {"Total Score": 60},
+            "C": {"Total Score": 60},
+            "D": {"Total Score": 80},
+        }
+        self.assertEqual(
+            last_ranked_students(course_data, course_matches, student_marks),
+            ["B", "D", None],
+        )
+
+    def test_non_numeric_total(self):
+        # 'ABS' is compared as NaN: it only wins when it comes first
+        course_data = {"Art": _course(5), "Music": _course(5)}
+        course_matches = {"Art": ["S1"], "Music": ["S2", "S3"]}
+        student_marks = {
+            "S1": {"Total Score": "ABS"},
+            "S2": {"Total Score": 70},
+            "S3": {"Total Score": "ABS"},
+        }
+        self.assertEqual(
+            last_ranked_students(course_data, course_matches, student_marks),
+            ["S1", "S2"],
+        )
+
+
+class RunMatchingCoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def _write_inputs(self, students, courses):
+        student_path = os.path.join(self.tmp, "students.xlsx")
+        course_path = os.path.join(self.tmp, "courses.xlsx")
+        pd.DataFrame(students).to_excel(student_path, index=False)
+        pd.DataFrame(courses).to_excel(course_path, index=False)
+        return student_path, course_path
+
+    def test_non_numeric_total_in_course_report(self):
+        student_path, course_path = self._write_inputs(
+            {
+                "Student Name": ["S1", "S2"],
+                "Preference 1": ["Art", "Music"],
+                "Math": [50, 60],
+                "Total Score": ["ABS", 70],
+            },
+            {
+                "Course Name": ["Art", "Music"],
+                "Capacity": [5, 5],
+                "Group": [None, None],
+                "Group Constraint": [None, None],
+                "Tiebreaker Subjects": [None, None],
+                "Math": [None, None],
+            },
+        )
+        result = run_matching_core(
+            student_path, course_path, os.path.join(self.tmp, "out"), save_excel=False
+        )
+        report = result["course_report_df"].set_index("Course Name")
+        self.assertEqual(report.loc["Art", "Last Ranked Student Posted"], "S1")
+        self.assertEqual(report.loc["Art", "Last Ranked Student Overall Score"], "ABS")
+        self.assertEqual(report.loc["Music", "Last Ranked Student Overall Score"], 70)
+
+
+class CreateCourseReportTest(unittest.TestCase):
+    def test_non_numeric_total(self):
+        out = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, out, ignore_errors=True)
+        course_data = {"Art": _course(5), "Music": _course(5)}
+        course_matches = {"Art": ["S1"], "Music": ["S2"]}
+        student_marks = {"S1": {"Total Score": "ABS"}, "S2": {"Total Score": 70}}
+
+        create_course_report(course_data, course_matches, student_marks, out)
+
+        report = pd.read_excel(os.path.join(out, "course_report.xlsx")).set_index("Course Name")
+        self.assertEqual(report.loc["Art", "Last Ranked Student Overall Score"], "ABS")
+        self.assertEqual(report.loc["Music", "Last Ranked Student Posted"], "S2")
+
+
+if __name__ == "__main__":
+    unittest.main()